@@ -61,7 +61,7 @@ def scrape_and_process(state: ResearchState) -> ResearchState:
     return {"documents": all_documents}
 
 def ingest_and_embed(state: ResearchState) -> ResearchState:
-    """Takes scraped documents, creates a vector store, and saves its path."""
+    """Adds scraped documents to the shared corpus under the topic and saves the corpus path."""
     if not state["documents"]:
         print("---No documents to ingest. Skipping vector store creation.---")
         return {"topic_index_path": ""}
@@ -69,14 +69,14 @@ def ingest_and_embed(state: ResearchState) -> ResearchState:
     return {"topic_index_path": index_path}
 
 def synthesize_initial_report(state: ResearchState) -> ResearchState:
-    """Generates the initial full report based on the newly created vector store."""
+    """Generates the initial full report from the topic's chunks in the shared corpus."""
     print("---SYNTHESIZING INITIAL REPORT---")
     if not model: raise ConnectionError("Model not configured.")
     topic = state["topic"]
     if not state["topic_index_path"]:
         return {"report": "Could not generate a report because no documents were successfully scraped and indexed."}
         
-    context_docs = query_vector_store(topic, state["topic_index_path"])
+    context_docs = query_vector_store(topic, state["topic_index_path"], topic=topic)
     context_str = "\n\n---\n\n".join([f"Source ({doc.metadata['source']}):\n{doc.page_content}" for doc in context_docs])
     
     prompt = f"""You are a research analyst. Based on the following documents, write a detailed, comprehensive research report on the topic: "{topic}".
@@ -93,11 +93,11 @@ def synthesize_initial_report(state: ResearchState) -> ResearchState:
 # --- NEW AGENT FOR THE Q&A PHASE ---
 
 def answer_follow_up_question(state: ResearchState) -> ResearchState:
-    """Answers a specific follow-up question using the topic's vector store."""
+    """Answers a specific follow-up question using the topic's chunks (or the whole corpus if no topic is set)."""
     print("---ANSWERING FOLLOW-UP QUESTION---")
     if not model: raise ConnectionError("Model not configured.")
     question = state["follow_up_question"]
-    context_docs = query_vector_store(question, state["topic_index_path"])
+    context_docs = query_vector_store(question, state["topic_index_path"], topic=state.get("topic"))
     context_str = "\n\n---\n\n".join([f"Source ({doc.metadata['source']}):\n{doc.page_content}" for doc in context_docs])
 
     prompt = f"""Based *only* on the provided documents, answer the following question: "{question}"
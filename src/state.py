@@ -12,7 +12,7 @@ class ResearchState(TypedDict):
     report: str
 
     # State for the persistent RAG system
-    topic_index_path: str  # Path to the created vector store for the topic
+    topic_index_path: str  # Path to the shared corpus the topic's chunks were added to
     
     # State for the Q&A phase
     follow_up_question: str
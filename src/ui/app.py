@@ -71,6 +71,7 @@ else:
             # Prepare the state needed for the Q&A agent
             qa_state = {
                 "follow_up_question": prompt,
+                "topic": st.session_state.topic,
                 "topic_index_path": st.session_state.index_path
             }
             # Call the Q&A agent directly
@@ -1,30 +1,148 @@
 import os
+import json
+import hashlib
+import shutil
+import threading
 import faiss
-import pickle
+import numpy as np
 import time
+from dotenv import load_dotenv
+from contextlib import contextmanager
+from typing import Optional
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS # Corrected import
 
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+
+load_dotenv()
+
 try:
     embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
 except Exception as e:
     print(f"Error initializing embedding model: {e}")
     embeddings = None
 
-def create_vector_store(topic: str, documents: list[dict]):
+# All topics share one corpus: each chunk is embedded and stored once, and a
+# topics file maps every topic to the ids of the chunks that belong to it.
+# FAISS generations (gen-*/) and topics files (topics-*.json) are immutable once
+# written; CURRENT (replaced atomically) names the live pair, so they never get
+# out of step and a re-tag-only update just writes a new topics file.
+CORPUS_PATH = os.path.join(os.getenv("INDEX_DIR", "./indexes"), "corpus")
+CURRENT_FILE = "CURRENT"
+LOCK_FILE = "corpus.lock"
+
+# Loaded corpora keyed by path, so opening another topic doesn't reload the index.
+# Cached entries are never mutated; writers build a new one and swap it in.
+_corpus_cache = {}
+# Serialises writers within this process; the lock file serialises them across processes.
+_corpus_lock = threading.Lock()
+
+def _topic_key(topic: str) -> str:
+    return "".join(c for c in topic if c.isalnum() or c in (' ', '_')).rstrip().replace(" ", "_").lower()
+
+def _chunk_id(source: str, text: str) -> str:
+    """Content-addressed id, so the same chunk found under two topics maps to one entry."""
+    return hashlib.sha1(f"{source}\n{text}".encode("utf-8")).hexdigest()
+
+def _read_pointer(index_path: str) -> Optional[dict]:
+    path = os.path.join(index_path, CURRENT_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _row_map(vectorstore) -> dict[str, int]:
+    return {doc_id: row for row, doc_id in vectorstore.index_to_docstore_id.items()}
+
+def _read_topics(index_path: str, pointer: dict) -> dict[str, list[str]]:
+    with open(os.path.join(index_path, pointer["topics"]), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _read_index(index_path: str, pointer: dict):
+    # allow_dangerous_deserialization is required for loading FAISS indexes with pickle
+    return FAISS.load_local(os.path.join(index_path, pointer["index"]), embeddings, allow_dangerous_deserialization=True)
+
+def _load_corpus(index_path: str) -> dict:
+    """Returns the cached corpus, reloading whatever another writer has republished since."""
+    for _ in range(3):
+        pointer = _read_pointer(index_path)
+        if pointer is None:
+            return {"pointer": None, "vectorstore": None, "topics": {}, "rows": {}}
+        cached = _corpus_cache.get(index_path)
+        if cached is not None and cached["pointer"] == pointer:
+            return cached
+        try:
+            topics = _read_topics(index_path, pointer)
+            if cached is not None and cached["pointer"]["index"] == pointer["index"]:
+                # Only topic membership changed: keep the loaded index
+                vectorstore, rows = cached["vectorstore"], cached["rows"]
+            else:
+                vectorstore = _read_index(index_path, pointer)
+                rows = _row_map(vectorstore)
+        except FileNotFoundError:
+            # A writer replaced this version while we were loading it; follow CURRENT again
+            continue
+        corpus = {"pointer": pointer, "vectorstore": vectorstore, "topics": topics, "rows": rows}
+        _corpus_cache[index_path] = corpus
+        return corpus
+    raise FileNotFoundError(f"Corpus at {index_path} kept changing while loading it.")
+
+def _publish(index_path: str, pointer: dict):
+    """Atomically points CURRENT at the given index and topics file, then removes older versions."""
+    tmp_path = os.path.join(index_path, CURRENT_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(pointer, f)
+    os.replace(tmp_path, os.path.join(index_path, CURRENT_FILE))
+
+    # Readers that lose a removed version retry from CURRENT, so nothing older is kept
+    for name in os.listdir(index_path):
+        path = os.path.join(index_path, name)
+        if name.startswith("gen-") and name != pointer["index"]:
+            shutil.rmtree(path, ignore_errors=True)
+        elif name.startswith("topics-") and name != pointer["topics"]:
+            os.remove(path)
+
+@contextmanager
+def _locked_corpus(index_path: str):
+    """Holds the in-process lock and an OS lock on the corpus lock file; the OS drops it if we crash."""
+    with _corpus_lock:
+        with open(os.path.join(index_path, LOCK_FILE), "a+") as f:
+            f.seek(0)
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            else:
+                while True:
+                    try:
+                        msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        time.sleep(0.1)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                else:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def create_vector_store(topic: str, documents: list[dict], index_path: str = CORPUS_PATH):
     """
-    Chunks, embeds, and stores documents in a new FAISS index for a specific topic.
-    Processes documents in small, slow batches to respect API rate limits.
+    Chunks and embeds documents into the shared corpus and makes them the topic's chunk set.
+    Chunks already in the corpus (e.g. found under another topic) are not re-embedded.
+    Re-researching a topic replaces its chunk set; chunks no other topic uses are then dropped.
+    Embeds new chunks in small, slow batches to respect API rate limits, without holding the
+    corpus lock; the lock is only taken to merge the results and publish them.
     """
     if not embeddings:
         raise ConnectionError("Google Generative AI Embeddings model failed to initialize.")
-        
-    print(f"--- CREATING VECTOR STORE FOR TOPIC: {topic} ---")
-    
-    sanitized_topic = "".join(c for c in topic if c.isalnum() or c in (' ', '_')).rstrip().replace(" ", "_")
-    index_path = os.path.join("indexes", sanitized_topic)
-    
+
+    print(f"--- ADDING TOPIC TO CORPUS: {topic} ---")
+
     if not os.path.exists(index_path):
         os.makedirs(index_path)
 
@@ -36,55 +154,114 @@ def create_vector_store(topic: str, documents: list[dict]):
 
     text_splitter = RecursiveCharacterTextSplitter(chunk_size=1500, chunk_overlap=200)
     split_texts = text_splitter.create_documents(texts_to_embed, metadatas=metadatas)
-    
+
     if not split_texts:
         print("--- No text to embed. Skipping vector store creation. ---")
         return None
 
+    # Duplicate chunks within this run collapse to one
+    chunks = {}
+    for chunk in split_texts:
+        chunk_id = _chunk_id(chunk.metadata["source"], chunk.page_content)
+        chunk.metadata["chunk_id"] = chunk_id
+        chunks.setdefault(chunk_id, chunk)
+
+    known = _load_corpus(index_path)["rows"]
+    new_ids = [chunk_id for chunk_id in chunks if chunk_id not in known]
+    vectors = {}
+
     # --- MORE ROBUST BATCHING LOGIC ---
-    print(f"Embedding {len(split_texts)} chunks in small, slow batches to respect free-tier limits...")
+    print(f"Embedding {len(new_ids)} new chunks ({len(chunks) - len(new_ids)} already in corpus) in small, slow batches to respect free-tier limits...")
     batch_size = 1 # Process 1 chunk at a time for maximum safety
-    vectorstore = None
 
-    for i in range(0, len(split_texts), batch_size):
-        batch = split_texts[i:i + batch_size]
-        
+    for i in range(0, len(new_ids), batch_size):
+        batch_ids = new_ids[i:i + batch_size]
+
         try:
-            if vectorstore is None:
-                # Create the initial vector store with the very first batch
-                vectorstore = FAISS.from_documents(documents=batch, embedding=embeddings)
-            else:
-                # Add subsequent batches to the existing store
-                vectorstore.add_documents(batch)
-                
-            print(f"  - Embedded batch {i + 1}/{len(split_texts)}...")
+            batch_vectors = embeddings.embed_documents([chunks[c].page_content for c in batch_ids])
+            vectors.update(zip(batch_ids, batch_vectors))
+
+            print(f"  - Embedded batch {i + 1}/{len(new_ids)}...")
             # Wait between each request to be extra safe with requests-per-minute limits
-            time.sleep(2) 
+            time.sleep(2)
         except Exception as e:
             print(f"  - Error embedding batch {i + 1}: {e}")
             print("  - Skipping this batch and continuing...")
             time.sleep(5) # Wait longer after an error
             continue
     # --- END OF NEW LOGIC ---
-    
-    if vectorstore:
-        vectorstore.save_local(index_path)
-        print(f"--- VECTOR STORE CREATED AT: {index_path} ---")
-        return index_path
-    else:
-        print("--- Vector store creation failed because no chunks could be embedded. ---")
-        return None
 
-def query_vector_store(query: str, index_path: str):
+    with _locked_corpus(index_path):
+        # Another writer may have published since the snapshot above
+        corpus = _load_corpus(index_path)
+        topic_index = dict(corpus["topics"])
+        key = _topic_key(topic)
+
+        topic_ids = [c for c in chunks if c in corpus["rows"] or c in vectors]
+        if not topic_ids:
+            print("--- Vector store creation failed because no chunks could be embedded. ---")
+            return None
+
+        to_add = [c for c in topic_ids if c not in corpus["rows"]]
+        still_used = {c for t, ids in topic_index.items() if t != key for c in ids} | set(topic_ids)
+        orphans = [c for c in topic_index.get(key, []) if c not in still_used and c in corpus["rows"]]
+        topic_index[key] = topic_ids
+
+        pointer = dict(corpus["pointer"] or {})
+        vectorstore, rows = corpus["vectorstore"], corpus["rows"]
+        if to_add or orphans:
+            text_embeddings = [(chunks[c].page_content, vectors[c]) for c in to_add]
+            added_metadatas = [chunks[c].metadata for c in to_add]
+            if vectorstore is None:
+                vectorstore = FAISS.from_embeddings(text_embeddings, embeddings, metadatas=added_metadatas, ids=to_add)
+            else:
+                # Modify a private copy; the cached store may be in use by readers
+                vectorstore = _read_index(index_path, corpus["pointer"])
+                if to_add:
+                    vectorstore.add_embeddings(text_embeddings, metadatas=added_metadatas, ids=to_add)
+                if orphans:
+                    vectorstore.delete(orphans)
+            rows = _row_map(vectorstore)
+            pointer["index"] = f"gen-{time.time_ns()}"
+            vectorstore.save_local(os.path.join(index_path, pointer["index"]))
+
+        pointer["topics"] = f"topics-{time.time_ns()}.json"
+        with open(os.path.join(index_path, pointer["topics"]), "w", encoding="utf-8") as f:
+            json.dump(topic_index, f, indent=2)
+        _publish(index_path, pointer)
+        _corpus_cache[index_path] = {"pointer": pointer, "vectorstore": vectorstore, "topics": topic_index, "rows": rows}
+
+    print(f"--- TOPIC '{topic}' HAS {len(topic_ids)} CHUNKS IN CORPUS AT: {index_path} ---")
+    return index_path
+
+def query_vector_store(query: str, index_path: str = CORPUS_PATH, topic: Optional[str] = None, k: int = 5):
+    """
+    Searches the shared corpus. With a topic, only that topic's chunks are considered;
+    without one, the search runs across every topic.
+    """
     if not embeddings:
         raise ConnectionError("Google Generative AI Embeddings model failed to initialize.")
-        
+
     if not os.path.exists(index_path):
         raise FileNotFoundError(f"Index not found at path: {index_path}")
 
-    # allow_dangerous_deserialization is required for loading FAISS indexes with pickle
-    vectorstore = FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
+    corpus = _load_corpus(index_path)
+    vectorstore = corpus["vectorstore"]
+    if vectorstore is None:
+        raise FileNotFoundError(f"Index not found at path: {index_path}")
+
+    if topic is None:
+        return vectorstore.similarity_search(query, k=k)
 
-    results = vectorstore.similarity_search(query, k=5)
-    return results
+    chunk_ids = corpus["topics"].get(_topic_key(topic))
+    if not chunk_ids:
+        return []
 
+    # Restrict the FAISS search to the topic's rows instead of post-filtering the global top-k
+    rows = np.array([corpus["rows"][c] for c in chunk_ids if c in corpus["rows"]], dtype="int64")
+    if not len(rows):
+        return []
+    params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(rows))
+    query_vector = np.array([embeddings.embed_query(query)], dtype="float32")
+    _, found = vectorstore.index.search(query_vector, min(k, len(rows)), params=params)
+    return [vectorstore.docstore.search(vectorstore.index_to_docstore_id[row]) for row in found[0] if row != -1]
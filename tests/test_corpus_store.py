@@ -0,0 +1,112 @@
+import os
+import fcntl
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+import src.vectorstore as vs
+
+class CountingEmbedding(Embeddings):
+    def __init__(self):
+        self.inner = DeterministicFakeEmbedding(size=8)
+        self.embedded = []
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return self.inner.embed_documents(texts)
+    def embed_query(self, text):
+        return self.inner.embed_query(text)
+
+@pytest.fixture
+def corpus_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(vs, "embeddings", CountingEmbedding())
+    monkeypatch.setattr(vs.time, "sleep", lambda s: None)
+    monkeypatch.setattr(vs, "_corpus_cache", {})
+    return str(tmp_path / "corpus")
+
+def _lock_is_free(path):
+    with open(os.path.join(path, vs.LOCK_FILE), "a+") as f:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    return not vs._corpus_lock.locked()
+
+def test_shared_corpus_topic_filter(corpus_path):
+    p = corpus_path
+    shared = {"url": "https://a", "content": "shared article"}
+    vs.create_vector_store("EV batteries", [shared, {"url": "https://b", "content": "battery only"}], index_path=p)
+    assert len(vs.embeddings.embedded) == 2
+    vs.create_vector_store("LLM safety", [shared, {"url": "https://c", "content": "safety only"}], index_path=p)
+    # Only the new chunk is embedded for the second topic
+    assert vs.embeddings.embedded[2:] == ["safety only"]
+
+    vs._corpus_cache.clear()
+    corpus = vs._load_corpus(p)
+    assert corpus["vectorstore"].index.ntotal == 3
+    shared_id = vs._chunk_id("https://a", "shared article")
+    assert [t for t, ids in corpus["topics"].items() if shared_id in ids] == ["ev_batteries", "llm_safety"]
+
+    res = vs.query_vector_store("anything", index_path=p, topic="LLM safety", k=5)
+    assert {d.metadata["source"] for d in res} == {"https://a", "https://c"}
+    assert len(vs.query_vector_store("anything", index_path=p, k=5)) == 3
+
+def test_rerun_replaces_topic_chunks(corpus_path):
+    p = corpus_path
+    shared = {"url": "https://a", "content": "shared article"}
+    vs.create_vector_store("EV batteries", [shared, {"url": "https://b", "content": "old page"}], index_path=p)
+    vs.create_vector_store("LLM safety", [shared], index_path=p)
+    vs.create_vector_store("EV batteries", [{"url": "https://d", "content": "new page"}], index_path=p)
+
+    res = vs.query_vector_store("anything", index_path=p, topic="EV batteries", k=5)
+    assert [d.metadata["source"] for d in res] == ["https://d"]
+    corpus = vs._load_corpus(p)
+    # The old page is dropped; the shared chunk stays for the other topic
+    assert corpus["vectorstore"].index.ntotal == 2
+    assert corpus["topics"]["llm_safety"] == [vs._chunk_id("https://a", "shared article")]
+
+def test_retag_only_keeps_index_generation(corpus_path):
+    p = corpus_path
+    shared = {"url": "https://a", "content": "shared article"}
+    vs.create_vector_store("EV batteries", [shared], index_path=p)
+    before = vs._read_pointer(p)
+    vs.create_vector_store("LLM safety", [shared], index_path=p)
+    after = vs._read_pointer(p)
+    assert after["index"] == before["index"] and after["topics"] != before["topics"]
+    assert sorted(n for n in os.listdir(p) if n.startswith("topics-")) == [after["topics"]]
+
+def test_reloads_after_another_writer_publishes(corpus_path):
+    p = corpus_path
+    vs.create_vector_store("EV batteries", [{"url": "https://a", "content": "first"}], index_path=p)
+    stale = dict(vs._corpus_cache)
+    # A second writer (e.g. another process) publishes without touching our cache
+    vs.create_vector_store("LLM safety", [{"url": "https://b", "content": "second"}], index_path=p)
+    vs._corpus_cache.clear()
+    vs._corpus_cache.update(stale)
+
+    res = vs.query_vector_store("anything", index_path=p, topic="LLM safety", k=5)
+    assert [d.metadata["source"] for d in res] == ["https://b"]
+    assert vs._corpus_cache[p]["vectorstore"].index.ntotal == 2
+
+def test_old_generations_are_removed(corpus_path):
+    p = corpus_path
+    for i in range(4):
+        vs.create_vector_store(f"topic {i}", [{"url": f"https://{i}", "content": f"page {i}"}], index_path=p)
+    generations = [n for n in os.listdir(p) if n.startswith("gen-")]
+    assert len(generations) <= 2
+    assert vs._read_pointer(p)["index"] in generations
+    assert vs._load_corpus(p)["vectorstore"].index.ntotal == 4
+
+def test_lock_released_when_embedding_or_publish_fails(corpus_path, monkeypatch):
+    p = corpus_path
+    def fail(texts):
+        raise RuntimeError("quota exceeded")
+    monkeypatch.setattr(vs.embeddings, "embed_documents", fail)
+    assert vs.create_vector_store("EV batteries", [{"url": "https://a", "content": "page"}], index_path=p) is None
+    assert _lock_is_free(p)
+
+    monkeypatch.setattr(vs.embeddings, "embed_documents", vs.embeddings.inner.embed_documents)
+    def broken_publish(index_path, pointer):
+        raise OSError("disk full")
+    monkeypatch.setattr(vs, "_publish", broken_publish)
+    with pytest.raises(OSError):
+        vs.create_vector_store("EV batteries", [{"url": "https://a", "content": "page"}], index_path=p)
+    assert _lock_is_free(p)